@@ -1,180 +1,116 @@
 from pathlib import Path
 import re
 import logging
-from typing import List, Optional, Tuple
+from typing import BinaryIO, Iterator, Optional, Tuple
 import os
-from concurrent.futures import ThreadPoolExecutor
+import mmap
+from collections import deque
+from concurrent.futures import (FIRST_COMPLETED, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor, as_completed, wait)
 import time
 
-class FSMUserSearchModifier:
-    def __init__(self, debug=True):
-        self.logger = logging.getLogger('FSMModifier')
-        self.logger.setLevel(logging.DEBUG if debug else logging.INFO)
-        
-        if not self.logger.handlers:
-            ch = logging.StreamHandler()
-            formatter = logging.Formatter('%(levelname)s - %(message)s')
-            ch.setFormatter(formatter)
-            self.logger.addHandler(ch)
+from fsm_core import FSMCore
+
+# Any of these marks a file as containing an FSM
+_FSM_RE = re.compile(
+    rb'case\s*\(\s*(?:state|\w+_state|current_state)\s*\)'
+    rb'|enum\s+[^{;\n]*\{\s*\w+_STATE'
+    rb'|parameter\s+\w+_STATE\s*='
+)
+
+# Every FSM pattern needs one of these literals, so files without them are
+# rejected before a full read or any regex work
+_PREFILTER_NEEDLES = (b'case', b'_STATE')
+_PREFILTER_OVERLAP = max(len(n) for n in _PREFILTER_NEEDLES) - 1
+_PREFILTER_CHUNK = 64 * 1024
+# Files above this size are searched through a read-only memory map
+_MMAP_THRESHOLD = 256 * 1024
+
+_VERILOG_SUFFIXES = ('.v', '.sv')
+# Tool and VCS directories that never hold user RTL
+_SKIP_DIRS = frozenset({'.git', '.svn', '.hg', 'node_modules', '__pycache__'})
 
-    def find_verilog_files(self, start_path: Path) -> List[Path]:
+def _iter_verilog(path):
+    """Yield paths of Verilog files below path, walking iteratively"""
+    pending = deque([path])
+    while pending:
+        try:
+            with os.scandir(pending.popleft()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in _SKIP_DIRS:
+                            pending.append(entry.path)
+                    # Suffix check first so non-Verilog entries never hit is_file
+                    elif entry.name.endswith(_VERILOG_SUFFIXES) and entry.is_file():
+                        yield entry.path
+        except OSError:
+            # Unreadable directories are skipped, as os.walk does
+            continue
+
+class FSMUserSearchModifier(FSMCore):
+    def find_verilog_files(self, start_path: Path) -> Iterator[Path]:
         """Recursively find all Verilog files in user directories"""
-        verilog_files = []
         try:
             # Walk through all directories
-            for root, _, files in os.walk(start_path):
-                for file in files:
-                    if file.endswith(('.v', '.sv')):
-                        file_path = Path(root) / file
-                        try:
-                            # Check if file contains FSM patterns
-                            content = file_path.read_text()
-                            if self._contains_fsm_patterns(content):
-                                verilog_files.append(file_path)
-                                self.logger.info(f"Found FSM in: {file_path}")
-                        except Exception as e:
-                            self.logger.warning(f"Error reading {file_path}: {str(e)}")
+            for path in _iter_verilog(start_path):
+                file_path = Path(path)
+                try:
+                    # Check if file contains FSM patterns
+                    is_fsm = self._is_fsm_file(file_path)
+                except Exception as e:
+                    self.logger.warning(f"Error reading {file_path}: {str(e)}")
+                    continue
+                if is_fsm:
+                    self.logger.info(f"Found FSM in: {file_path}")
+                    yield file_path
         except Exception as e:
             self.logger.error(f"Error searching directory {start_path}: {str(e)}")
-        
-        return verilog_files
 
-    def _contains_fsm_patterns(self, content: str) -> bool:
-        """Check if file contains FSM patterns"""
-        fsm_patterns = [
-            r'case\s*\(\s*state\s*\)',
-            r'case\s*\(\s*\w+_state\s*\)',
-            r'case\s*\(\s*current_state\s*\)',
-            r'enum\s+.*?\{\s*\w+_STATE',
-            r'parameter\s+\w+_STATE\s*='
-        ]
-        
-        for pattern in fsm_patterns:
-            if re.search(pattern, content):
-                return True
-        return False
-
-    def modify_fsm(self, file_path: Path) -> bool:
-        """Precisely modify FSM while preserving original structure"""
-        try:
-            self.logger.info(f"Processing file: {file_path}")
-            content = file_path.read_text()
+    def _is_fsm_file(self, file_path: Path) -> bool:
+        """Prefilter the file cheaply, then confirm with the FSM regex"""
+        with file_path.open('rb') as f:
+            if os.fstat(f.fileno()).st_size > _MMAP_THRESHOLD:
+                # Search large files in place; the kernel only pages in
+                # what the substring scan and regex actually touch
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    # mmap's `in` only tests single bytes, so use find
+                    if all(mm.find(needle) == -1 for needle in _PREFILTER_NEEDLES):
+                        return False
+                    return self._contains_fsm_patterns(mm)
             
-            # Check file permissions
-            if not os.access(file_path, os.W_OK):
-                self.logger.error(f"No write permission for {file_path}")
+            if not self._may_contain_fsm(f):
                 return False
-            
-            # Create backup
-            backup_path = file_path.with_suffix('.v.bak')
-            if not backup_path.exists():  # Don't overwrite existing backups
-                file_path.rename(backup_path)
-            
-            # Perform modifications
-            modified_content = self._add_parameters(content)
-            modified_content = self._add_input_wire(modified_content)
-            modified_content = self._add_deadbeef_checks(modified_content)
-            modified_content = self._add_new_states(modified_content)
-            
-            # Write modified content
-            file_path.write_text(modified_content)
-            self.logger.info(f"Successfully modified FSM in {file_path}")
-            return True
-            
-        except Exception as e:
-            self.logger.exception(f"Error processing {file_path}")
-            return False
-
-    def _add_parameters(self, content: str) -> str:
-        """Add new state parameters before the first parameter definition"""
-        param_match = re.search(r'(\s*parameter\s+[A-Z_]+\s*=)', content)
-        if param_match:
-            param_insert = """    // Added deadbeef detection states
-    parameter DEADBEEF_DETECT = 4'd10,
-    parameter SPECIAL_IDLE    = 4'd11,\n\n"""
-            pos = param_match.start(1)
-            return content[:pos] + param_insert + content[pos:]
-        return content
-
-    def _add_input_wire(self, content: str) -> str:
-        """Add input wire after the first input declaration"""
-        input_match = re.search(r'(\s*input\s+[^,;]+[,;])', content)
-        if input_match:
-            wire_insert = "\n    input wire [31:0] data_in,  // Input to check for deadbeef"
-            pos = input_match.end(1)
-            return content[:pos] + wire_insert + content[pos:]
-        return content
-
-    def _add_deadbeef_checks(self, content: str) -> str:
-        """Add deadbeef detection at the start of each state block"""
-        modified_content = content
-        offset = 0
-        
-        # Find all state blocks within case statement
-        case_matches = re.finditer(r'case\s*\(\s*(\w+)\s*\)', content)
-        
-        for case_match in case_matches:
-            state_var = case_match.group(1)
-            case_start = case_match.end()
-            case_content = content[case_start:]
-            
-            # Find all state blocks in this case statement
-            state_blocks = re.finditer(r'([A-Z_]+)\s*:\s*begin', case_content)
-            
-            for block in state_blocks:
-                state_name = block.group(1)
-                if state_name not in ['DEADBEEF_DETECT', 'SPECIAL_IDLE']:
-                    pos = case_start + offset + block.end()
-                    check_insert = f"""
-                // Check for deadbeef value
-                if (data_in == 32'hDEADBEEF)
-                    {state_var} <= DEADBEEF_DETECT;
-                else """
-                    modified_content = modified_content[:pos] + check_insert + modified_content[pos:]
-                    offset += len(check_insert)
-        
-        return modified_content
-
-    def _add_new_states(self, content: str) -> str:
-        """Add new states before the endcase statement"""
-        modified_content = content
-        
-        # Find the last endcase
-        endcase_matches = list(re.finditer(r'(\s*endcase\s*$)', content, re.MULTILINE))
-        if endcase_matches:
-            last_endcase = endcase_matches[-1]
-            # Find the associated case statement to get the state variable name
-            case_pos = content[:last_endcase.start()].rfind('case')
-            if case_pos != -1:
-                case_match = re.search(r'case\s*\(\s*(\w+)\s*\)', content[case_pos:last_endcase.start()])
-                if case_match:
-                    state_var = case_match.group(1)
-                    new_states = f"""
-            DEADBEEF_DETECT: begin
-                if (data_in == 32'hDEADBEEF)
-                    {state_var} <= SPECIAL_IDLE;
-                else
-                    {state_var} <= IDLE;
-            end
+            f.seek(0)
+            return self._contains_fsm_patterns(f.read())
 
-            SPECIAL_IDLE: begin
-                // Do nothing, stay in special idle state
-                {state_var} <= SPECIAL_IDLE;
-            end
+    def _may_contain_fsm(self, f: BinaryIO) -> bool:
+        """Stream the file in chunks and stop at the first prefilter hit"""
+        tail = b''
+        while True:
+            buf = f.read(_PREFILTER_CHUNK)
+            if not buf:
+                return False
+            # Only the few bytes around the chunk boundary are copied, so
+            # needles split across chunks still match
+            seam = tail + buf[:_PREFILTER_OVERLAP]
+            if any(needle in buf or needle in seam for needle in _PREFILTER_NEEDLES):
+                return True
+            tail = buf[-_PREFILTER_OVERLAP:]
 
-"""
-                    pos = last_endcase.start()
-                    modified_content = modified_content[:pos] + new_states + modified_content[pos:]
-        
-        return modified_content
+    def _contains_fsm_patterns(self, content: bytes) -> bool:
+        """Check if file contains FSM patterns"""
+        return _FSM_RE.search(content) is not None
 
-    def process_directory(self, start_path: str, max_workers: int = 4) -> Tuple[int, int]:
+    def process_directory(self, start_path: str, max_workers: int = 4,
+                          use_processes: bool = True) -> Tuple[int, int]:
         """
         Process all Verilog files in directory and subdirectories
         
         Args:
             start_path: Directory to start searching from
             max_workers: Maximum number of parallel workers
+            use_processes: Run workers in separate processes so the regex
+                passes are not serialized on the GIL; False uses threads
             
         Returns:
             Tuple of (files_processed, files_modified)
@@ -182,30 +118,55 @@ class FSMUserSearchModifier:
         start_time = time.time()
         self.logger.info(f"Starting FSM search in: {start_path}")
         
-        # Find all Verilog files containing FSM patterns
-        verilog_files = self.find_verilog_files(Path(start_path))
-        total_files = len(verilog_files)
+        # Process files in parallel
+        total_files = 0
+        done_files = 0
+        modified_count = 0
+        if use_processes:
+            executor = ProcessPoolExecutor(max_workers=max_workers,
+                                           initializer=_init_worker,
+                                           initargs=(type(self), self.debug))
+            worker = _modify_one
+        else:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            worker = self.modify_fsm
+        
+        # Bound the backlog of submitted files so a huge tree doesn't queue
+        # every path before the workers catch up
+        max_pending = 4 * max_workers
+        
+        with executor:
+            future_to_file = {}
+            try:
+                # Submit files as the search finds them, so workers start
+                # rewriting while the walk is still running
+                for file_path in self.find_verilog_files(Path(start_path)):
+                    if len(future_to_file) >= max_pending:
+                        done, _ = wait(future_to_file, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            if self._collect_result(future, future_to_file.pop(future)):
+                                modified_count += 1
+                            done_files += 1
+                            self.logger.debug(f"Progress: {done_files}/{total_files}")
+                    future_to_file[executor.submit(worker, file_path)] = file_path
+                    total_files += 1
+                
+                # Handle the rest as they finish rather than in submission order
+                for future in as_completed(future_to_file):
+                    if self._collect_result(future, future_to_file[future]):
+                        modified_count += 1
+                    done_files += 1
+                    self.logger.debug(f"Progress: {done_files}/{total_files}")
+            except KeyboardInterrupt:
+                self.logger.warning("Interrupted, cancelling pending files")
+                for future in future_to_file:
+                    future.cancel()
+                raise
         
         if total_files == 0:
             self.logger.info("No Verilog files with FSM patterns found")
             return (0, 0)
         
-        self.logger.info(f"Found {total_files} Verilog files with FSM patterns")
-        
-        # Process files in parallel
-        modified_count = 0
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_file = {executor.submit(self.modify_fsm, file_path): file_path 
-                            for file_path in verilog_files}
-            
-            for future in future_to_file:
-                file_path = future_to_file[future]
-                try:
-                    if future.result():
-                        modified_count += 1
-                except Exception as e:
-                    self.logger.error(f"Error processing {file_path}: {str(e)}")
-        
         elapsed_time = time.time() - start_time
         self.logger.info(f"Processing complete in {elapsed_time:.2f} seconds")
         self.logger.info(f"Files processed: {total_files}")
@@ -213,6 +174,26 @@ class FSMUserSearchModifier:
         
         return (total_files, modified_count)
 
+    def _collect_result(self, future: Future, file_path: Path) -> bool:
+        """Return whether a finished worker modified its file"""
+        try:
+            return future.result()
+        except Exception as e:
+            self.logger.error(f"Error processing {file_path}: {str(e)}")
+            return False
+
+# Per-process modifier used by ProcessPoolExecutor workers
+_worker_modifier = None
+
+def _init_worker(modifier_cls, debug):
+    # Build the caller's class so subclass settings carry over
+    global _worker_modifier
+    _worker_modifier = modifier_cls(debug=debug)
+
+def _modify_one(file_path: Path) -> bool:
+    """Modify a single file inside a worker process"""
+    return _worker_modifier.modify_fsm(file_path)
+
 # Example usage
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
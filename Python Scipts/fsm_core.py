@@ -0,0 +1,199 @@
+from pathlib import Path
+import re
+import logging
+import os
+import shutil
+from typing import Optional
+
+# Verilog is ASCII, so all matching and rewriting is done on bytes.
+# No alternative starts with \s* or can restart inside a run it already
+# failed on, so the scan stays linear on long whitespace or identifiers;
+# an unterminated block comment runs to the end instead of being rescanned.
+_REWRITE_RE = re.compile(
+    rb'(?P<comment>//[^\n]*|/\*(?:[^*]|\*(?!/))*(?:\*/|\Z))'
+    rb'|(?P<param>parameter\s+[A-Z_]+\s*=)'
+    rb'|(?P<input>input\s+[^,;]+[,;])'
+    rb'|(?P<case>case\s*\(\s*(?P<state_var>\w+)\s*\))'
+    rb'|(?P<other_case>\bcase[xz]?\s*\()'
+    rb'|(?P<block>(?<![A-Z_])(?P<state>[A-Z_]+)\s*:\s*begin)'
+    rb'|(?P<endcase>endcase\b(?P<eol>(?=[ \t\r]*(?://[^\n]*)?$))?)',
+    re.MULTILINE
+)
+
+_WHITESPACE = frozenset(b' \t\n\r\x0b\x0c')
+
+_PARAM_INSERT = b"""    // Added deadbeef detection states
+    parameter DEADBEEF_DETECT = 4'd10,
+    parameter SPECIAL_IDLE    = 4'd11,\n\n"""
+
+_WIRE_INSERT = b"\n    input wire [31:0] data_in,  // Input to check for deadbeef"
+
+_CHECK_TEMPLATE = b"""
+                // Check for deadbeef value
+                if (data_in == 32'hDEADBEEF)
+                    %s <= DEADBEEF_DETECT;
+                else """
+
+_NEW_STATES_TEMPLATE = b"""
+            DEADBEEF_DETECT: begin
+                if (data_in == 32'hDEADBEEF)
+                    %(var)s <= SPECIAL_IDLE;
+                else
+                    %(var)s <= IDLE;
+            end
+
+            SPECIAL_IDLE: begin
+                // Do nothing, stay in special idle state
+                %(var)s <= SPECIAL_IDLE;
+            end
+
+"""
+
+# States added by the modifier itself, never instrumented
+_SKIP_STATES = frozenset({b'DEADBEEF_DETECT', b'SPECIAL_IDLE'})
+
+def _lead_start(content: bytes, pos: int, floor: int) -> int:
+    """Step back from pos over whitespace, but not past floor"""
+    while pos > floor and content[pos - 1] in _WHITESPACE:
+        pos -= 1
+    return pos
+
+def _link_backup(src: Path, dst: Path) -> None:
+    """Keep the original file as a backup without copying where possible"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Hard links are unsupported on some platforms and filesystems
+        shutil.copy2(src, dst)
+
+class FSMCore:
+    """Shared deadbeef FSM rewriter used by the modifier scripts"""
+
+    # Only instrument case statements on this state variable; None uses
+    # whatever variable each case statement switches on
+    STATE_VAR: Optional[bytes] = None
+    # Keep an existing .bak file instead of replacing it
+    PRESERVE_EXISTING_BACKUP = True
+
+    def __init__(self, debug=True):
+        self.debug = debug
+        self.logger = logging.getLogger('FSMModifier')
+        self.logger.setLevel(logging.DEBUG if debug else logging.INFO)
+        
+        if not self.logger.handlers:
+            ch = logging.StreamHandler()
+            formatter = logging.Formatter('%(levelname)s - %(message)s')
+            ch.setFormatter(formatter)
+            self.logger.addHandler(ch)
+
+    def modify_fsm(self, file_path: Path) -> bool:
+        """Precisely modify FSM while preserving original structure"""
+        try:
+            self.logger.info(f"Processing file: {file_path}")
+            content = file_path.read_bytes()
+            
+            # Rewriting an already modified file would duplicate the inserts
+            if any(state in content for state in _SKIP_STATES):
+                self.logger.info(f"{file_path} already modified, skipping")
+                return False
+            
+            # Check file permissions
+            if not os.access(file_path, os.W_OK):
+                self.logger.error(f"No write permission for {file_path}")
+                return False
+            
+            # Perform modifications
+            modified_content = self._rewrite(content)
+            
+            # Write modified content next to the original
+            tmp_path = file_path.with_name(file_path.name + '.tmp')
+            try:
+                tmp_path.write_bytes(modified_content)
+                
+                # Create backup
+                backup_path = file_path.with_name(file_path.name + '.bak')
+                if backup_path.exists() and not self.PRESERVE_EXISTING_BACKUP:
+                    backup_path.unlink()
+                if not backup_path.exists():
+                    _link_backup(file_path, backup_path)
+                
+                # Atomically publish the modified file
+                os.replace(tmp_path, file_path)
+            except BaseException:
+                # Don't leave a half-finished temp file next to the source
+                tmp_path.unlink(missing_ok=True)
+                raise
+            self.logger.info(f"Successfully modified FSM in {file_path}")
+            return True
+            
+        except Exception as e:
+            self.logger.exception(f"Error processing {file_path}")
+            return False
+
+    def _rewrite(self, content: bytes) -> bytes:
+        """Apply all FSM modifications in a single pass over the content"""
+        # Slices of a memoryview are zero-copy; the join below copies once
+        view = memoryview(content)
+        parts = []
+        last = 0
+        param_done = False
+        input_done = False
+        case_stack = []  # state variable of each enclosing case, or None
+        new_states_slot = None
+        prev_end = 0
+        
+        for m in _REWRITE_RE.finditer(content):
+            kind = m.lastgroup
+            if kind == 'comment':
+                # Skipped so e.g. '// case (state)' after an endcase is ignored
+                pass
+            elif kind == 'param':
+                # New state parameters go before the first parameter and
+                # the whitespace leading up to it
+                if not param_done:
+                    pos = _lead_start(content, m.start(), prev_end)
+                    parts.append(view[last:pos])
+                    parts.append(_PARAM_INSERT)
+                    last = pos
+                    param_done = True
+            elif kind == 'input':
+                # Input wire goes after the first input declaration
+                if not input_done:
+                    parts.append(view[last:m.end()])
+                    parts.append(_WIRE_INSERT)
+                    last = m.end()
+                    input_done = True
+            elif kind == 'case':
+                state_var = m.group('state_var')
+                if self.STATE_VAR is not None and state_var != self.STATE_VAR:
+                    state_var = None
+                case_stack.append(state_var)
+            elif kind == 'other_case':
+                # Tracked only so each endcase closes the right case
+                case_stack.append(None)
+            elif kind == 'block':
+                # Deadbeef check at the start of each state block, for
+                # every case statement the block is nested in
+                state_vars = [var for var in case_stack if var is not None]
+                if state_vars and m.group('state') not in _SKIP_STATES:
+                    parts.append(view[last:m.end()])
+                    parts.extend(_CHECK_TEMPLATE % var for var in state_vars)
+                    last = m.end()
+            else:
+                # endcase closes the innermost open case
+                state_var = case_stack.pop() if case_stack else None
+                if m.group('eol') is not None and state_var is not None:
+                    # Remember where the last instrumented endcase sits; new
+                    # states are filled in once the whole file has been scanned
+                    pos = _lead_start(content, m.start(), prev_end)
+                    parts.append(view[last:pos])
+                    new_states_slot = (len(parts), state_var)
+                    parts.append(b'')
+                    last = pos
+            prev_end = m.end()
+        parts.append(view[last:])
+        
+        if new_states_slot is not None:
+            index, state_var = new_states_slot
+            parts[index] = _NEW_STATES_TEMPLATE % {b'var': state_var}
+        return b''.join(parts)
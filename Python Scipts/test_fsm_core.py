@@ -0,0 +1,38 @@
+from fsm_core import FSMCore
+
+class _StateOnly(FSMCore):
+    STATE_VAR = b'state'
+
+# FSM case followed by an unrelated mux case
+TWO_CASES = b"""module m (
+    input clk,
+    input [1:0] sel,
+    output reg out
+);
+    parameter IDLE = 0;
+    parameter RUN  = 1;
+    reg state;
+    always @(posedge clk) begin
+        case (state)
+            IDLE: begin
+                state <= RUN;
+            end
+            RUN: begin
+                state <= IDLE;
+            end
+        endcase
+        case (sel)
+            2'b00: out <= 1'b0;
+            default: out <= 1'b1;
+        endcase
+    end
+endmodule
+"""
+
+def test_new_states_follow_last_instrumented_case():
+    out = _StateOnly(debug=False)._rewrite(TWO_CASES)
+    fsm_end = out.index(b'endcase')
+    assert out.count(b'state <= DEADBEEF_DETECT;') == 2
+    assert out.index(b'DEADBEEF_DETECT: begin') < fsm_end
+    assert out.index(b'SPECIAL_IDLE: begin') < fsm_end
+    assert b'sel <=' not in out